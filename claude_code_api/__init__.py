@@ -9,6 +9,13 @@ __version__ = "1.0.0"
 __author__ = "Claude Code API Team"
 __description__ = "OpenAI-compatible API gateway for Claude Code with streaming support"
 
-from .main import app
-
 __all__ = ["app"]
+
+
+def __getattr__(name):
+    # Import the FastAPI app lazily so that importing a submodule such as
+    # claude_code_api.core.config does not build the whole application
+    if name == "app":
+        from .main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -130,13 +130,13 @@ class ClaudeProcess:
                 return_code=self.process.returncode,
                 stdout_length=len(stdout) if stdout else 0,
                 stderr_length=len(stderr) if stderr else 0,
-                stderr_preview=stderr.decode()[:200] if stderr else "empty",
-                stdout_preview=stdout.decode()[:200] if stdout else "empty"
+                stderr_preview=stderr[:200].decode(errors="replace") if stderr else "empty",
+                stdout_preview=stdout[:200].decode(errors="replace") if stdout else "empty"
             )
             
             # Check for API key related errors in stderr
             if stderr and self.key_manager:
-                error_type = detect_claude_error(stderr.decode())
+                error_type = detect_claude_error(stderr)
                 if error_type:
                     logger.warning(
                         "Detected Claude API error",
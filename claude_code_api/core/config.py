@@ -2,13 +2,24 @@
 
 import os
 import shutil
-from typing import List, Union, Optional, Any
+from functools import lru_cache
+from typing import List, Dict, Union, Optional, Any
 from pydantic import Field, field_validator, ValidationInfo
 from pydantic_settings import BaseSettings, SettingsConfigDict
+import structlog
 
+try:
+    # Optional speedup, see the "speedups" extra
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
+logger = structlog.get_logger()
+
+
+@lru_cache(maxsize=1)
 def find_claude_binary() -> str:
-    """Find Claude binary path automatically."""
+    """Find Claude binary path automatically (resolved once per process)."""
     # First check environment variable
     if 'CLAUDE_BINARY_PATH' in os.environ:
         claude_path = os.environ['CLAUDE_BINARY_PATH']
@@ -20,6 +31,15 @@ def find_claude_binary() -> str:
     if claude_path:
         return claude_path
     
+    claude_path = _find_claude_binary_fallback()
+    if claude_path != "claude":
+        # Share the result with reloaded workers and child processes
+        os.environ['CLAUDE_BINARY_PATH'] = claude_path
+    return claude_path
+
+
+def _find_claude_binary_fallback() -> str:
+    """Slow path: ask npm for its global bin dir, then scan common locations."""
     # Import npm environment if needed
     try:
         import subprocess
@@ -84,7 +104,7 @@ class Settings(BaseSettings):
         return []
     
     # Claude Configuration  
-    claude_binary_path: str = find_claude_binary()
+    claude_binary_path: str = Field(default="", validate_default=True)
     claude_api_key: str = ""
     default_model: str = "claude-3-5-sonnet-20241022"
     max_concurrent_sessions: int = 10
@@ -92,10 +112,40 @@ class Settings(BaseSettings):
     
     # Claude API Key Pool (JSON string)
     claude_api_keys: str = ""
+    claude_api_keys_parsed: List[Dict[str, Any]] = Field(
+        default_factory=list, validate_default=True
+    )
     claude_auto_rotate: bool = True
     claude_restart_on_rotate: bool = True
     claude_current_key_index: int = 0
     
+    @field_validator('claude_api_keys_parsed', mode='before')
+    @classmethod
+    def parse_claude_api_keys(cls, v, info: ValidationInfo):
+        if v:
+            return v
+        keys_config = info.data.get('claude_api_keys')
+        if not keys_config:
+            return []
+        try:
+            keys = _json_loads(keys_config)
+        except ValueError as e:
+            logger.error("Failed to parse API keys configuration", error=str(e))
+            return []
+        if not isinstance(keys, list) or not all(isinstance(key, dict) for key in keys):
+            logger.error(
+                "Failed to parse API keys configuration",
+                error="expected a JSON list of key objects"
+            )
+            return []
+        return keys
+    
+    @field_validator('claude_binary_path', mode='after')
+    @classmethod
+    def resolve_claude_binary_path(cls, v):
+        # Only run discovery when no path was configured
+        return v or find_claude_binary()
+    
     # Project Configuration
     project_root: str = "/tmp/claude_projects"
     max_project_size_mb: int = 1000
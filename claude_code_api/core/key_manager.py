@@ -1,60 +1,97 @@
 """Claude API Key rotation and management."""
 
 import asyncio
-import json
 import os
+import re
+import shlex
+import shutil
+import tempfile
+import threading
 import time
-from typing import List, Dict, Optional, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Tuple, Union
 import structlog
 
+from .config import settings
+
 logger = structlog.get_logger()
 
+# Single worker so shell config rewrites run off the event loop, in order
+_shell_config_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shell-config")
+
+_TOKEN_RE = re.compile(r'^export ANTHROPIC_AUTH_TOKEN=.*$', re.M)
+
+# Common Claude CLI error patterns, in priority order
+_ERROR_PATTERNS = {
+    "insufficient_quota": ["insufficient quota", "quota exceeded", "billing", "usage limit"],
+    "rate_limit": ["rate limit", "too many requests", "throttle"],
+    "auth_error": ["authentication", "invalid api key", "unauthorized"],
+    "server_error": ["internal server error", "service unavailable", "timeout"]
+}
+_ERROR_PRIORITY = {error_type: rank for rank, error_type in enumerate(_ERROR_PATTERNS)}
+_ERROR_RE = re.compile(
+    '|'.join(
+        f'(?P<{error_type}>{"|".join(map(re.escape, patterns))})'
+        for error_type, patterns in _ERROR_PATTERNS.items()
+    ),
+    re.IGNORECASE
+)
+# Same patterns for raw subprocess output, so stderr need not be decoded
+_ERROR_BYTES_RE = re.compile(_ERROR_RE.pattern.encode(), re.IGNORECASE)
+
 
 class ClaudeKeyManager:
     """Manages Claude API key rotation and failover."""
     
-    def __init__(self, keys_config: str):
-        """Initialize with keys configuration from environment."""
-        self.keys: List[Dict[str, Any]] = []
+    def __init__(self, keys: List[Dict[str, Any]]):
+        """Initialize with the parsed keys configuration from settings."""
+        self.keys: List[Dict[str, Any]] = list(keys)
+        # Display names and configured statuses never change, compute them once
+        self._key_names = [key.get('name', f'key_{i}') for i, key in enumerate(self.keys)]
+        self._key_statuses = [key.get('status', 'active') for key in self.keys]
         self.current_index = 0
         self.last_rotation_time = 0
-        self.failed_keys = set()
+        # Indices of keys that have not failed, in rotation order
+        self._available: "OrderedDict[int, None]" = OrderedDict()
+        # Bumped whenever the set of available keys changes
+        self._status_version = 0
+        self._keys_status_cache: Optional[Tuple[Tuple[int, int], List[Dict[str, Any]]]] = None
+        # Shell config file contents keyed by path, tagged with their mtime
+        self._config_file_cache: Dict[str, Tuple[int, str]] = {}
+        # (token, base_url) of the key last applied to the environment
+        self._last_applied: Optional[Tuple[str, str]] = None
         
-        try:
-            # Parse keys from JSON string
-            if keys_config:
-                self.keys = json.loads(keys_config)
-                logger.info("Loaded API keys", count=len(self.keys))
-            else:
-                logger.warning("No API keys configuration found")
-                
-        except json.JSONDecodeError as e:
-            logger.error("Failed to parse API keys configuration", error=str(e))
-            self.keys = []
+        if self.keys:
+            logger.info("Loaded API keys", count=len(self.keys))
+        else:
+            logger.warning("No API keys configuration found")
+        
+        self._reset_available()
+    
+    def _reset_available(self):
+        """Mark all keys available again, starting from the current one."""
+        total = len(self.keys)
+        self._available = OrderedDict.fromkeys(
+            (self.current_index + i) % total for i in range(total)
+        )
+        self._status_version += 1
     
     def get_current_key(self) -> Optional[Dict[str, Any]]:
         """Get the currently active API key."""
         if not self.keys:
             return None
-            
-        # Skip failed keys
-        attempts = 0
-        while attempts < len(self.keys):
-            key = self.keys[self.current_index]
-            if self.current_index not in self.failed_keys:
-                return key
-            
-            # Move to next key
-            self.current_index = (self.current_index + 1) % len(self.keys)
-            attempts += 1
         
-        # All keys failed, reset and try again
-        if self.failed_keys:
-            logger.warning("All keys failed, resetting failed keys list")
-            self.failed_keys.clear()
-            return self.keys[self.current_index] if self.keys else None
-            
-        return None
+        if self.current_index not in self._available:
+            if self._available:
+                # Skip to the next key that has not failed
+                self.current_index = next(iter(self._available))
+            else:
+                # All keys failed, reset and try again
+                logger.warning("All keys failed, resetting failed keys list")
+                self._reset_available()
+        
+        return self.keys[self.current_index]
     
     def mark_key_failed(self, reason: str = "unknown") -> bool:
         """Mark current key as failed and rotate to next."""
@@ -62,22 +99,24 @@ class ClaudeKeyManager:
             return False
             
         current_key = self.keys[self.current_index]
-        self.failed_keys.add(self.current_index)
+        self._available.pop(self.current_index, None)
+        self._status_version += 1
+        self._last_applied = None
         
         logger.warning(
             "Marking API key as failed",
             key_name=current_key.get('name', 'unnamed'),
             key_index=self.current_index,
             reason=reason,
-            failed_count=len(self.failed_keys)
+            failed_count=len(self.keys) - len(self._available)
         )
         
         # Rotate to next key
         success = self.rotate_key()
         
-        # Apply the new key to environment and config files
+        # Apply the newly selected key to environment and config files
         if success:
-            self.apply_current_key()
+            self._apply_key(self.keys[self.current_index])
         
         # Trigger process restart if configured
         if success and self._should_restart_on_rotate():
@@ -93,11 +132,7 @@ class ClaudeKeyManager:
     
     def _should_restart_on_rotate(self) -> bool:
         """Check if process should be restarted after key rotation."""
-        try:
-            from .config import settings
-            return getattr(settings, 'claude_restart_on_rotate', False)
-        except ImportError:
-            return False
+        return settings.claude_restart_on_rotate
     
     async def _restart_process(self):
         """Restart the server process after key rotation."""
@@ -124,22 +159,27 @@ class ClaudeKeyManager:
             return False
             
         old_index = self.current_index
-        self.current_index = (self.current_index + 1) % len(self.keys)
+        if self._available:
+            # Send the current key to the back of the rotation order
+            if old_index in self._available:
+                self._available.move_to_end(old_index)
+            self.current_index = next(iter(self._available))
+        else:
+            # All keys failed, reset and start over from the next key
+            logger.warning("All keys failed, resetting failed keys list")
+            self.current_index = (old_index + 1) % len(self.keys)
+            self._reset_available()
         self.last_rotation_time = time.time()
         
-        new_key = self.get_current_key()
-        if new_key:
-            logger.info(
-                "Rotated API key",
-                from_index=old_index,
-                to_index=self.current_index,
-                new_key_name=new_key.get('name', 'unnamed'),
-                total_keys=len(self.keys)
-            )
-            return True
-        else:
-            logger.error("No available keys for rotation")
-            return False
+        new_key = self.keys[self.current_index]
+        logger.info(
+            "Rotated API key",
+            from_index=old_index,
+            to_index=self.current_index,
+            new_key_name=new_key.get('name', 'unnamed'),
+            total_keys=len(self.keys)
+        )
+        return True
     
     def apply_current_key(self) -> bool:
         """Apply the current key to environment variables and update shell config files."""
@@ -147,16 +187,36 @@ class ClaudeKeyManager:
         if not key:
             logger.error("No available API key to apply")
             return False
-            
+        
+        return self._apply_key(key)
+    
+    def _apply_key(self, key: Dict[str, Any]) -> bool:
+        """Apply the given key to environment variables and shell config files."""
         try:
+            signature = (key['token'], key.get('base_url', ''))
+            if (
+                signature == self._last_applied
+                and os.environ.get('ANTHROPIC_AUTH_TOKEN') == signature[0]
+            ):
+                # Already live, skip the environment and shell config rewrite
+                return True
+            
             # Set environment variables that Claude CLI uses
             os.environ['ANTHROPIC_AUTH_TOKEN'] = key['token']
             if 'base_url' in key:
                 os.environ['ANTHROPIC_BASE_URL'] = key['base_url']
             
-            # Update shell configuration files
-            self._update_shell_config_files(key['token'])
+            # Update shell configuration files, off the event loop when there is one
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._update_shell_config_files(key['token'])
+            else:
+                loop.run_in_executor(
+                    _shell_config_executor, self._update_shell_config_files, key['token']
+                )
             
+            self._last_applied = signature
             logger.info(
                 "Applied API key to environment and config files",
                 key_name=key.get('name', 'unnamed'),
@@ -171,36 +231,43 @@ class ClaudeKeyManager:
     
     def _update_shell_config_files(self, new_token: str):
         """Update ANTHROPIC_AUTH_TOKEN in shell configuration files."""
-        import os.path
-        import subprocess
-        
         # List of shell configuration files to update
         config_files = [
             os.path.expanduser("~/.bash_profile"),
             os.path.expanduser("~/.bashrc"),
             os.path.expanduser("~/.zshrc")
         ]
+        export_line = f'export ANTHROPIC_AUTH_TOKEN={shlex.quote(new_token)}'
         
         for config_file in config_files:
             try:
-                if os.path.exists(config_file):
-                    # Check if ANTHROPIC_AUTH_TOKEN exists in the file
+                try:
+                    mtime = os.stat(config_file).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                
+                cached = self._config_file_cache.get(config_file)
+                if cached and cached[0] == mtime:
+                    content = cached[1]
+                else:
                     with open(config_file, 'r') as f:
                         content = f.read()
-                    
-                    if 'ANTHROPIC_AUTH_TOKEN' in content:
-                        # Use sed to replace the existing token
-                        subprocess.run([
-                            'sed', '-i', 
-                            f's/export ANTHROPIC_AUTH_TOKEN=.*/export ANTHROPIC_AUTH_TOKEN={new_token}/',
-                            config_file
-                        ], check=True)
-                        logger.info(f"Updated ANTHROPIC_AUTH_TOKEN in {config_file}")
-                    else:
-                        # Add the token if it doesn't exist
-                        with open(config_file, 'a') as f:
-                            f.write(f'\nexport ANTHROPIC_AUTH_TOKEN={new_token}\n')
-                        logger.info(f"Added ANTHROPIC_AUTH_TOKEN to {config_file}")
+                
+                # Replace existing exports in place, append one otherwise
+                new_content, count = _TOKEN_RE.subn(lambda _: export_line, content)
+                if count == 0:
+                    new_content = f'{content}\n{export_line}\n'
+                elif new_content == content:
+                    # Token already up to date, nothing to write
+                    self._config_file_cache[config_file] = (mtime, content)
+                    continue
+                
+                new_mtime = _atomic_write(config_file, new_content)
+                self._config_file_cache[config_file] = (new_mtime, new_content)
+                if count:
+                    logger.info(f"Updated ANTHROPIC_AUTH_TOKEN in {config_file}")
+                else:
+                    logger.info(f"Added ANTHROPIC_AUTH_TOKEN to {config_file}")
                         
             except Exception as e:
                 logger.warning(f"Failed to update {config_file}", error=str(e))
@@ -211,71 +278,103 @@ class ClaudeKeyManager:
         """Get current key manager status."""
         current_key = self.get_current_key()
         
+        # The per-key list only changes on rotation or failure, so reuse it
+        # until then (callers must treat it as read-only)
+        cache_key = (self._status_version, self.current_index)
+        if self._keys_status_cache is None or self._keys_status_cache[0] != cache_key:
+            available = self._available
+            current_index = self.current_index
+            keys_status = [
+                {
+                    "index": i,
+                    "name": name,
+                    "status": status if i in available else "failed",
+                    "current": i == current_index
+                }
+                for i, (name, status) in enumerate(zip(self._key_names, self._key_statuses))
+            ]
+            self._keys_status_cache = (cache_key, keys_status)
+        
         return {
             "total_keys": len(self.keys),
             "current_index": self.current_index,
             "current_key_name": current_key.get('name', 'unnamed') if current_key else None,
-            "failed_keys": len(self.failed_keys),
-            "available_keys": len(self.keys) - len(self.failed_keys),
+            "failed_keys": len(self.keys) - len(self._available),
+            "available_keys": len(self._available),
             "last_rotation": self.last_rotation_time,
-            "keys_status": [
-                {
-                    "index": i,
-                    "name": key.get('name', f'key_{i}'),
-                    "status": key.get('status', 'active') if i not in self.failed_keys else "failed",
-                    "current": i == self.current_index
-                }
-                for i, key in enumerate(self.keys)
-            ]
+            "keys_status": self._keys_status_cache[1]
         }
 
 
-def detect_claude_error(stderr_output: str) -> Optional[str]:
-    """Detect Claude API errors from stderr output."""
+def _atomic_write(path: str, content: str) -> int:
+    """Replace a file's content atomically, keeping its permissions.
+    
+    Returns the new file's mtime in nanoseconds.
+    """
+    # Write through symlinks (e.g. dotfile managers) rather than replacing them
+    path = os.path.realpath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+        return mtime
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def detect_claude_error(stderr_output: Union[str, bytes]) -> Optional[str]:
+    """Detect Claude API errors from stderr output (text or raw bytes)."""
     if not stderr_output:
         return None
-        
-    stderr_lower = stderr_output.lower()
     
-    # Common error patterns
-    error_patterns = {
-        "insufficient_quota": ["insufficient quota", "quota exceeded", "billing", "usage limit"],
-        "rate_limit": ["rate limit", "too many requests", "throttle"],
-        "auth_error": ["authentication", "invalid api key", "unauthorized"],
-        "server_error": ["internal server error", "service unavailable", "timeout"]
-    }
+    error_re = _ERROR_BYTES_RE if isinstance(stderr_output, bytes) else _ERROR_RE
     
-    for error_type, patterns in error_patterns.items():
-        if any(pattern in stderr_lower for pattern in patterns):
-            return error_type
+    # Scan once, keeping the highest-priority error type seen
+    detected = None
+    for match in error_re.finditer(stderr_output):
+        error_type = match.lastgroup
+        if detected is None or _ERROR_PRIORITY[error_type] < _ERROR_PRIORITY[detected]:
+            detected = error_type
+            if _ERROR_PRIORITY[detected] == 0:
+                break
     
-    return None
+    return detected
 
 
 # Global key manager instance to maintain state across requests
 _global_key_manager: Optional[ClaudeKeyManager] = None
+_key_manager_lock = threading.Lock()
 
 
 def create_key_manager_from_config() -> Optional[ClaudeKeyManager]:
     """Get or create key manager from environment configuration (singleton pattern)."""
     global _global_key_manager
     
+    # Fast path: no locking once the manager exists
     if _global_key_manager is not None:
         return _global_key_manager
     
-    from .config import settings
-    
-    keys_config = getattr(settings, 'claude_api_keys', '')
-    if not keys_config:
-        logger.warning("No Claude API keys configuration found in settings")
-        return None
-    
-    _global_key_manager = ClaudeKeyManager(keys_config)
-    logger.info("Created global key manager instance")
-    return _global_key_manager
+    with _key_manager_lock:
+        if _global_key_manager is not None:
+            return _global_key_manager
+        
+        keys = settings.claude_api_keys_parsed
+        if not keys:
+            logger.warning("No Claude API keys configuration found in settings")
+            return None
+        
+        _global_key_manager = ClaudeKeyManager(keys)
+        logger.info("Created global key manager instance")
+        return _global_key_manager
 
 
 def reset_key_manager():
     """Reset global key manager (for testing purposes)."""
     global _global_key_manager
-    _global_key_manager = None
\ No newline at end of file
+    with _key_manager_lock:
+        _global_key_manager = None
\ No newline at end of file
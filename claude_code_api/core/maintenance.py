@@ -3,14 +3,42 @@
 import os
 import time
 import shutil
+import signal
 import asyncio
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Tuple
 import structlog
 
 logger = structlog.get_logger()
 
+try:
+    from psutil import pid_exists as _pid_exists
+except ImportError:
+    def _pid_exists(pid: int) -> bool:
+        """Fallback: use kill -0 to check if process exists."""
+        try:
+            os.kill(pid, 0)
+            return True
+        except (OSError, ProcessLookupError):
+            return False
+
+# Rotated logs are compressed once and rarely read, so favour speed
+_COMPRESS_LEVEL = 1
+_COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+async def _wait_exit(pid: int, timeout: float, poll_start: float = 0.05) -> bool:
+    """Wait for a process to exit, polling with exponential backoff."""
+    deadline = time.monotonic() + timeout
+    delay = poll_start
+    while time.monotonic() < deadline:
+        if not _pid_exists(pid):
+            return True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    return not _pid_exists(pid)
+
 
 class LogManager:
     """Manages log rotation, cleanup, and archiving."""
@@ -31,7 +59,7 @@ class LogManager:
         size_mb = self.log_file.stat().st_size / (1024 * 1024)
         return size_mb > self.max_size_mb
     
-    def rotate_logs(self) -> bool:
+    async def rotate_logs(self) -> bool:
         """Rotate current log file and create archive."""
         try:
             if not self.log_file.exists():
@@ -42,10 +70,10 @@ class LogManager:
             archived_log = self.log_dir / f"claude_api_{timestamp}.log"
             
             # Move current log to archive
-            shutil.move(str(self.log_file), str(archived_log))
+            await asyncio.to_thread(shutil.move, str(self.log_file), str(archived_log))
             
             # Compress archived log to save space
-            self._compress_log_sync(archived_log)
+            await self._compress_log(archived_log)
             
             logger.info(
                 "Log rotated successfully",
@@ -59,6 +87,10 @@ class LogManager:
             logger.error("Failed to rotate logs", error=str(e))
             return False
     
+    async def _compress_log(self, log_path: Path) -> bool:
+        """Compress log file using gzip in a worker thread."""
+        return await asyncio.to_thread(self._compress_log_sync, log_path)
+    
     def _compress_log_sync(self, log_path: Path) -> bool:
         """Compress log file using gzip (synchronous version)."""
         try:
@@ -67,8 +99,8 @@ class LogManager:
             compressed_path = log_path.with_suffix('.log.gz')
             
             with open(log_path, 'rb') as f_in:
-                with gzip.open(compressed_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+                with gzip.open(compressed_path, 'wb', compresslevel=_COMPRESS_LEVEL) as f_out:
+                    shutil.copyfileobj(f_in, f_out, _COMPRESS_CHUNK_SIZE)
             
             # Remove uncompressed file
             log_path.unlink()
@@ -80,17 +112,24 @@ class LogManager:
             logger.error("Failed to compress log", error=str(e))
             return False
     
+    def _iter_archived_logs(self) -> Iterator[Tuple[os.DirEntry, os.stat_result]]:
+        """Yield archived log entries with their stat result (one stat per file)."""
+        with os.scandir(self.log_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("claude_api_") and ".log" in entry.name:
+                    yield entry, entry.stat()
+    
     def cleanup_old_logs(self) -> int:
         """Remove log files older than keep_days."""
         try:
             cutoff_time = time.time() - (self.keep_days * 24 * 60 * 60)
             removed_count = 0
             
-            for log_file in self.log_dir.glob("claude_api_*.log*"):
-                if log_file.stat().st_mtime < cutoff_time:
-                    log_file.unlink()
+            for entry, stat in list(self._iter_archived_logs()):
+                if stat.st_mtime < cutoff_time:
+                    os.unlink(entry.path)
                     removed_count += 1
-                    logger.info("Removed old log file", file=str(log_file))
+                    logger.info("Removed old log file", file=entry.path)
             
             if removed_count > 0:
                 logger.info("Cleaned up old logs", removed_count=removed_count)
@@ -118,15 +157,20 @@ class LogManager:
                 )
             
             # Archived logs
-            archived_files = list(self.log_dir.glob("claude_api_*.log*"))
-            stats["archived_logs"] = len(archived_files)
+            archived_count = 0
+            total_size = 0
+            oldest_mtime = None
+            for _, stat in self._iter_archived_logs():
+                archived_count += 1
+                total_size += stat.st_size
+                if oldest_mtime is None or stat.st_mtime < oldest_mtime:
+                    oldest_mtime = stat.st_mtime
+            stats["archived_logs"] = archived_count
             
-            if archived_files:
-                total_size = sum(f.stat().st_size for f in archived_files)
+            if archived_count:
                 stats["total_archived_size_mb"] = round(total_size / (1024 * 1024), 2)
                 
-                oldest_file = min(archived_files, key=lambda f: f.stat().st_mtime)
-                age_days = (time.time() - oldest_file.stat().st_mtime) / (24 * 60 * 60)
+                age_days = (time.time() - oldest_mtime) / (24 * 60 * 60)
                 stats["oldest_log_age_days"] = round(age_days, 1)
             
             return stats
@@ -141,6 +185,24 @@ class ProcessManager:
     
     def __init__(self, pid_file: str = "claude_api.pid"):
         self.pid_file = Path(pid_file)
+        self._session = None
+    
+    async def _get_session(self):
+        """Get the shared HTTP session used for health checks."""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     def get_current_pid(self) -> Optional[int]:
         """Get the current server PID."""
@@ -154,16 +216,7 @@ class ProcessManager:
     
     def is_process_running(self, pid: int) -> bool:
         """Check if a process is running."""
-        try:
-            import psutil
-            return psutil.pid_exists(pid)
-        except ImportError:
-            # Fallback: use kill -0 to check if process exists
-            try:
-                os.kill(pid, 0)
-                return True
-            except (OSError, ProcessLookupError):
-                return False
+        return _pid_exists(pid)
     
     async def restart_server(self) -> bool:
         """Restart the API server gracefully."""
@@ -175,13 +228,12 @@ class ProcessManager:
                 
                 # Graceful shutdown first
                 try:
-                    os.kill(current_pid, 15)  # SIGTERM
-                    await asyncio.sleep(5)  # Wait for graceful shutdown
+                    os.kill(current_pid, signal.SIGTERM)
                     
-                    if self.is_process_running(current_pid):
+                    if not await _wait_exit(current_pid, timeout=5.0):
                         logger.warning("Graceful shutdown failed, forcing stop", pid=current_pid)
-                        os.kill(current_pid, 9)  # SIGKILL
-                        await asyncio.sleep(2)
+                        os.kill(current_pid, signal.SIGKILL)
+                        await _wait_exit(current_pid, timeout=2.0)
                         
                 except (OSError, ProcessLookupError):
                     pass  # Process already dead
@@ -212,23 +264,21 @@ class ProcessManager:
     async def health_check(self) -> dict:
         """Perform health check on the server."""
         try:
-            import aiohttp
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get('http://localhost:8010/health', timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "status": "healthy",
-                            "response_time_ms": response.headers.get("X-Response-Time", "unknown"),
-                            "data": data
-                        }
-                    else:
-                        return {
-                            "status": "unhealthy",
-                            "http_status": response.status
-                        }
-                        
+            session = await self._get_session()
+            async with session.get('http://localhost:8010/health') as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return {
+                        "status": "healthy",
+                        "response_time_ms": response.headers.get("X-Response-Time", "unknown"),
+                        "data": data
+                    }
+                else:
+                    return {
+                        "status": "unhealthy",
+                        "http_status": response.status
+                    }
+                    
         except Exception as e:
             return {
                 "status": "unreachable",
@@ -248,10 +298,10 @@ async def run_maintenance_tasks():
     try:
         # Log rotation
         if log_manager.should_rotate():
-            log_manager.rotate_logs()
+            await log_manager.rotate_logs()
         
         # Cleanup old logs
-        removed_logs = log_manager.cleanup_old_logs()
+        removed_logs = await asyncio.to_thread(log_manager.cleanup_old_logs)
         
         # Health check
         health = await process_manager.health_check()
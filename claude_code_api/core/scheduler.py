@@ -1,58 +1,221 @@
 """Background task scheduler for maintenance operations."""
 
 import asyncio
-from datetime import datetime, timedelta
-from typing import Callable, Optional
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 import structlog
 
 from .maintenance import run_maintenance_tasks, log_manager
 
-logger = structlog.get_logger()
+logger = structlog.get_logger().bind(component="scheduler")
+
+# Tolerance (seconds) for a tick that wakes up slightly before a task is due
+_TICK_SLACK = 1.0
+# Wait before retrying a task whose last run failed
+_RETRY_DELAY = 60.0
+# Longest wait between ticks, so wall-clock steps and host suspends (during
+# which the monotonic clock stops) delay a daily task by at most this much
+_IDLE_DELAY = 60.0
 
 
 class TaskScheduler:
     """Simple background task scheduler."""
     
-    def __init__(self):
+    def __init__(self, max_concurrent: int = 2, state_file: Optional[str] = None):
+        # Frozen into a tuple while the scheduler runs
         self.tasks = []
+        # Last run times by task name, persisted so restarts don't re-fire tasks
+        # Kept beside the rotated logs rather than in the working directory
+        self.state_file = Path(state_file) if state_file else log_manager.log_dir / "scheduler_state.json"
+        self._state: Dict[str, str] = {}
+        # Serializes state file writes so an older snapshot never lands last
+        self._state_lock: Optional[asyncio.Lock] = None
+        # Min-heap of (monotonic deadline, sequence, task); sequence breaks ties
+        self._heap: List[Tuple[float, int, dict]] = []
+        self._seq = itertools.count()
         self.running = False
         self._background_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tick_event: Optional[asyncio.Event] = None
+        self._wakeup_handle: Optional[asyncio.TimerHandle] = None
+        # Limits how many due tasks run at once
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._max_concurrent = max_concurrent
+        # Runs synchronous task functions off the event loop
+        self._executor: Optional[ThreadPoolExecutor] = None
     
-    def schedule_daily(self, func: Callable, hour: int = 2, minute: int = 0):
+    def schedule_daily(self, func: Callable, hour: int = 2, minute: int = 0, name: Optional[str] = None):
         """Schedule a function to run daily at specified time."""
-        self.tasks.append({
+        self._add_task({
             "func": func,
+            "name": self._task_name(func, name),
             "type": "daily",
             "hour": hour,
             "minute": minute,
-            "last_run": None
+            "last_run": None,
+            # Today's target, so a task not yet run today fires on the first tick
+            "next_run": datetime.combine(date.today(), dt_time(hour, minute)).timestamp()
         })
     
-    def schedule_interval(self, func: Callable, hours: int = 0, minutes: int = 0):
+    def schedule_interval(self, func: Callable, hours: int = 0, minutes: int = 0, name: Optional[str] = None):
         """Schedule a function to run at regular intervals."""
-        if hours == 0 and minutes == 0:
+        interval_seconds = hours * 3600 + minutes * 60
+        if interval_seconds <= 0:
             raise ValueError("Must specify at least hours or minutes")
             
-        self.tasks.append({
+        self._add_task({
             "func": func,
+            "name": self._task_name(func, name),
             "type": "interval",
             "hours": hours,
             "minutes": minutes,
-            "last_run": None
+            "interval_seconds": interval_seconds,
+            "last_run": None,
+            # Monotonic clock: intervals measure elapsed time, not wall time
+            "next_run": time.monotonic()
         })
     
+    def _task_name(self, func: Callable, name: Optional[str]) -> str:
+        """Get the unique name a task's last run is persisted under."""
+        name = name or getattr(func, "__name__", None)
+        if not name or name == "<lambda>":
+            raise ValueError("Pass name= for callables without a stable __name__")
+        if any(task["name"] == name for task in self.tasks):
+            raise ValueError(f"A task named {name!r} is already scheduled")
+        return name
+    
+    def _add_task(self, task: dict):
+        """Register a task and queue it by its next run time.
+        
+        Must be called from the event loop thread once the scheduler runs.
+        """
+        # Held while the task runs so executions never overlap
+        task["lock"] = asyncio.Lock()
+        if self.running:
+            # Replace the frozen tuple instead of mutating it, and wake the
+            # loop so it re-evaluates its next deadline
+            self._restore_last_run(task)
+            self.tasks = self.tasks + (task,)
+            heapq.heappush(self._heap, (self._deadline(task), next(self._seq), task))
+            self._tick_event.set()
+        else:
+            self.tasks.append(task)
+            heapq.heappush(self._heap, (self._deadline(task), next(self._seq), task))
+    
+    @staticmethod
+    def _deadline(task: dict) -> float:
+        """Get a task's next run time on the monotonic clock."""
+        if task["type"] == "daily":
+            # Daily targets are wall-clock timestamps
+            return time.monotonic() + (task["next_run"] - time.time())
+        return task["next_run"]
+    
     async def start(self):
         """Start the background scheduler."""
         if self.running:
             return
             
         self.running = True
+        self._bind_loop()
+        self.tasks = tuple(self.tasks)
+        self._state = await asyncio.to_thread(self._load_state)
+        self._restore_last_runs()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_concurrent, thread_name_prefix="sched"
+        )
         self._background_task = asyncio.create_task(self._run_scheduler())
         logger.info("Task scheduler started", scheduled_tasks=len(self.tasks))
     
+    def _bind_loop(self):
+        """Create the primitives tied to the running event loop.
+        
+        Done on every start() so the module-level scheduler can be
+        restarted on a new loop (e.g. a new TestClient lifespan).
+        """
+        self._loop = asyncio.get_running_loop()
+        self._tick_event = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        self._state_lock = asyncio.Lock()
+    
+    def _load_state(self) -> Dict[str, str]:
+        """Read persisted last run times, ignoring a missing or corrupt file."""
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load scheduler state", file=str(self.state_file), error=str(e))
+            return {}
+    
+    def _save_state(self, state: Dict[str, str]):
+        """Write last run times atomically."""
+        directory = self.state_file.parent
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def _restore_last_run(self, task: dict) -> bool:
+        """Apply a task's persisted last run time, if there is one."""
+        try:
+            last_run = datetime.fromisoformat(self._state[task["name"]])
+        except (KeyError, TypeError, ValueError):
+            return False
+        task["last_run"] = last_run
+        
+        if task["type"] == "daily":
+            target = datetime.combine(date.today(), dt_time(task["hour"], task["minute"]))
+            if last_run >= target:
+                # Already ran today: wait for tomorrow's slot
+                task["next_run"] = (target + timedelta(days=1)).timestamp()
+        else:
+            # Resume the interval from the last run instead of firing now
+            elapsed = max(0.0, time.time() - last_run.timestamp())
+            task["next_run"] = time.monotonic() + max(0.0, task["interval_seconds"] - elapsed)
+        return True
+    
+    def _restore_last_runs(self):
+        """Apply persisted last run times and re-queue the affected tasks."""
+        restored = False
+        for task in self.tasks:
+            restored |= self._restore_last_run(task)
+        
+        if restored:
+            self._heap = [(self._deadline(task), next(self._seq), task) for task in self.tasks]
+            heapq.heapify(self._heap)
+    
+    async def _persist_last_run(self, task_name: str, current_time: datetime):
+        """Record a task's last run time in the state file."""
+        self._state[task_name] = current_time.isoformat()
+        try:
+            async with self._state_lock:
+                # Snapshot under the lock so each write includes every earlier update
+                await asyncio.to_thread(self._save_state, dict(self._state))
+        except Exception as e:
+            logger.warning("Failed to save scheduler state", file=str(self.state_file), error=str(e))
+    
     async def stop(self):
         """Stop the background scheduler."""
         self.running = False
+        self.tasks = list(self.tasks)
+        
+        if self._wakeup_handle:
+            self._wakeup_handle.cancel()
+            self._wakeup_handle = None
         
         if self._background_task:
             self._background_task.cancel()
@@ -61,92 +224,194 @@ class TaskScheduler:
             except asyncio.CancelledError:
                 pass
         
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        
         logger.info("Task scheduler stopped")
     
     async def _run_scheduler(self):
-        """Main scheduler loop."""
+        """Main scheduler loop, waking when the earliest task is due.
+        
+        Wake-ups are armed with loop.call_at on an exact loop.time()
+        deadline and are not coalesced with other timers.
+        """
         try:
             while self.running:
-                current_time = datetime.now()
+                await self._tick()
                 
-                for task in self.tasks:
-                    if await self._should_run_task(task, current_time):
-                        await self._run_task(task, current_time)
+                # Sleep until the next task is due (task run time included)
+                if self._heap:
+                    delay = min(self._heap[0][0] - time.monotonic(), _IDLE_DELAY)
+                else:
+                    delay = _IDLE_DELAY
                 
-                # Sleep for 60 seconds before next check
-                await asyncio.sleep(60)
+                if delay <= 0:
+                    # Overran into the next deadline: just yield, no timer needed
+                    await asyncio.sleep(0)
+                else:
+                    await self._wait_until(self._loop.time() + delay)
                 
         except asyncio.CancelledError:
             raise
         except Exception as e:
             logger.error("Error in task scheduler", error=str(e))
     
-    async def _should_run_task(self, task: dict, current_time: datetime) -> bool:
-        """Check if a task should be run now."""
-        last_run = task.get("last_run")
+    async def _wait_until(self, deadline: float):
+        """Wait until the given loop.time() deadline."""
+        handle = self._loop.call_at(deadline, self._tick_event.set)
+        self._wakeup_handle = handle
+        try:
+            await self._tick_event.wait()
+        finally:
+            # stop() may already have cancelled and cleared the handle
+            handle.cancel()
+            self._wakeup_handle = None
+            self._tick_event.clear()
+    
+    async def _tick(self):
+        """Run every task whose next run time has been reached."""
+        now = time.monotonic()
+        now_ts = time.time()
+        self._refresh_daily_deadlines(now, now_ts)
         
-        if task["type"] == "daily":
-            # Check if it's time for daily task
-            target_time = current_time.replace(
-                hour=task["hour"], 
-                minute=task["minute"], 
-                second=0, 
-                microsecond=0
+        due = []
+        while self._heap and self._heap[0][0] - _TICK_SLACK <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        
+        if due:
+            current_time = datetime.fromtimestamp(now_ts)
+            await asyncio.gather(
+                *(self._run_and_requeue(task, current_time, now) for task in due),
+                return_exceptions=True
             )
-            
-            # If target time has passed today and we haven't run today
-            if current_time >= target_time:
-                if not last_run or last_run.date() < current_time.date():
-                    return True
-        
-        elif task["type"] == "interval":
-            # Check if enough time has passed since last run
-            interval = timedelta(hours=task["hours"], minutes=task["minutes"])
-            
-            if not last_run or (current_time - last_run) >= interval:
-                return True
+    
+    def _refresh_daily_deadlines(self, now: float, now_ts: float):
+        """Re-derive daily tasks' monotonic deadlines from the wall clock.
+        
+        The offset between the two clocks changes when the wall clock is
+        stepped or the host resumes from suspend.
+        """
+        if not any(task["type"] == "daily" for _, _, task in self._heap):
+            return
+        self._heap = [
+            (now + (task["next_run"] - now_ts) if task["type"] == "daily" else deadline, seq, task)
+            for deadline, seq, task in self._heap
+        ]
+        heapq.heapify(self._heap)
+    
+    async def _run_and_requeue(self, task: dict, current_time: datetime, now: float):
+        """Run a due task, then queue it for its next run."""
+        ran = True
+        try:
+            async with self._semaphore:
+                ran = await self._run_task(task, current_time)
+        finally:
+            # A skipped run is re-queued by the run still in progress
+            if ran:
+                # A failed run leaves its deadline in the past; retry it later
+                deadline = self._deadline(task)
+                if deadline <= now:
+                    deadline = time.monotonic() + _RETRY_DELAY
+                heapq.heappush(self._heap, (deadline, next(self._seq), task))
+    
+    def _schedule_next_run(self, task: dict):
+        """Advance a task's next run time past now."""
+        if task["type"] == "daily":
+            # Re-anchor on the calendar rather than adding 24h, so the task
+            # keeps its wall-clock time across DST changes and missed days
+            # (a tick may fire slightly early, so never before the slot just run)
+            now = max(datetime.now(), datetime.fromtimestamp(task["next_run"]))
+            run_time = dt_time(task["hour"], task["minute"])
+            target = datetime.combine(now.date(), run_time)
+            if target <= now:
+                target = datetime.combine(now.date() + timedelta(days=1), run_time)
+            task["next_run"] = target.timestamp()
+            return
+        
+        step, now_ts = task["interval_seconds"], time.monotonic()
+        next_run = task["next_run"] + step
+        if next_run <= now_ts:
+            # Fell behind (e.g. host suspended): skip the missed runs
+            missed = (now_ts - next_run) // step + 1
+            next_run += missed * step
+        task["next_run"] = next_run
+    
+    async def _run_task(self, task: dict, current_time: datetime) -> bool:
+        """Execute a scheduled task.
+        
+        Returns False if the task was skipped because it is still running.
+        """
+        # Resolved before the try so the error handler can always log it
+        task_name = task.get("name") or getattr(task.get("func"), "__name__", "unknown")
+        lock = task["lock"]
+        if lock.locked():
+            logger.warning("Skipping overlapping run of scheduled task", task=task_name)
+            return False
         
-        return False
+        async with lock:
+            await self._execute_task(task, task_name, current_time)
+        return True
     
-    async def _run_task(self, task: dict, current_time: datetime):
-        """Execute a scheduled task."""
+    async def _execute_task(self, task: dict, task_name: str, current_time: datetime):
+        """Run a task's function and record the outcome."""
+        started = time.perf_counter()
         try:
             func = task["func"]
-            task_name = func.__name__ if hasattr(func, '__name__') else str(func)
             
-            logger.info("Running scheduled task", task=task_name, time=current_time.isoformat())
+            logger.debug("Running scheduled task", task=task_name, time=current_time.isoformat())
             
             # Execute the task
             if asyncio.iscoroutinefunction(func):
                 await func()
             else:
-                func()
+                await asyncio.get_running_loop().run_in_executor(self._executor, func)
             
             # Update last run time
             task["last_run"] = current_time
+            self._schedule_next_run(task)
+            await self._persist_last_run(task_name, current_time)
             
-            logger.info("Scheduled task completed", task=task_name)
+            logger.info(
+                "Scheduled task completed",
+                task=task_name,
+                status="ok",
+                duration_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
             
         except Exception as e:
-            logger.error("Error running scheduled task", task=task_name, error=str(e))
+            logger.error(
+                "Error running scheduled task",
+                task=task_name,
+                status="error",
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                error=str(e)
+            )
 
 
 # Global scheduler instance
 scheduler = TaskScheduler()
 
 
+async def check_log_rotation():
+    """Rotate the log file if it has grown past its size limit."""
+    if log_manager.should_rotate():
+        await log_manager.rotate_logs()
+
+
 async def setup_maintenance_schedule():
     """Setup default maintenance schedule."""
     try:
+        # Tasks stay registered across stop(), so a restarted app only starts
+        registered = {task["name"] for task in scheduler.tasks}
+        
         # Daily log cleanup at 2:00 AM
-        scheduler.schedule_daily(run_maintenance_tasks, hour=2, minute=0)
+        if run_maintenance_tasks.__name__ not in registered:
+            scheduler.schedule_daily(run_maintenance_tasks, hour=2, minute=0)
         
         # Log rotation check every 6 hours
-        async def check_log_rotation():
-            if log_manager.should_rotate():
-                log_manager.rotate_logs()
-        
-        scheduler.schedule_interval(check_log_rotation, hours=6)
+        if check_log_rotation.__name__ not in registered:
+            scheduler.schedule_interval(check_log_rotation, hours=6)
         
         # Start the scheduler
         await scheduler.start()
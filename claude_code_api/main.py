@@ -95,6 +95,13 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     except Exception as e:
         logger.warning("Error stopping scheduler", error=str(e))
     
+    try:
+        # Close the health check HTTP session
+        from claude_code_api.core.maintenance import process_manager
+        await process_manager.close()
+    except Exception as e:
+        logger.warning("Error closing health check session", error=str(e))
+    
     # Cleanup sessions and database
     await app.state.session_manager.cleanup_all()
     await close_database()
@@ -3,17 +3,42 @@
 Generate secure API keys for Claude Code API Gateway
 """
 
+import base64
 import secrets
 import sys
 import argparse
 
 
-def generate_api_key(prefix: str = "cc", length: int = 32) -> str:
-    """Generate a secure API key."""
-    random_part = secrets.token_hex(length)
+KEY_FORMATS = ("hex", "urlsafe")
+
+
+def _encode(random_bytes: bytes, key_format: str) -> str:
+    """Encode random bytes the same way secrets.token_hex/token_urlsafe do."""
+    if key_format == "hex":
+        return random_bytes.hex()
+    return base64.urlsafe_b64encode(random_bytes).rstrip(b"=").decode("ascii")
+
+
+def generate_api_key(prefix: str = "cc", length: int = 32, key_format: str = "urlsafe") -> str:
+    """Generate a secure API key from `length` bytes of entropy."""
+    if key_format == "hex":
+        random_part = secrets.token_hex(length)
+    else:
+        random_part = secrets.token_urlsafe(length)
     return f"{prefix}_{random_part}"
 
 
+def generate_api_keys(
+    count: int, prefix: str = "cc", length: int = 32, key_format: str = "urlsafe"
+) -> list:
+    """Generate several secure API keys from a single random read."""
+    random_bytes = secrets.token_bytes(length * count)
+    return [
+        f"{prefix}_{_encode(random_bytes[i * length:(i + 1) * length], key_format)}"
+        for i in range(count)
+    ]
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate secure API keys for Claude Code API Gateway"
@@ -34,7 +59,13 @@ def main():
         "-l", "--length",
         type=int,
         default=32,
-        help="Length of random part in bytes (default: 32)"
+        help="Entropy bytes in the random part (default: 32)"
+    )
+    parser.add_argument(
+        "-f", "--format",
+        choices=KEY_FORMATS,
+        default="urlsafe",
+        help="Encoding of the random part: urlsafe base64 or hex (default: urlsafe)"
     )
     parser.add_argument(
         "--env",
@@ -44,20 +75,28 @@ def main():
     
     args = parser.parse_args()
     
-    keys = [generate_api_key(args.prefix, args.length) for _ in range(args.number)]
+    keys = generate_api_keys(args.number, args.prefix, args.length, args.format)
+    
+    api_keys_line = f"API_KEYS={','.join(keys)}"
     
     if args.env:
-        print(f"# Generated API keys for Claude Code API Gateway")
-        print(f"REQUIRE_AUTH=true")
-        print(f"API_KEYS={','.join(keys)}")
+        lines = [
+            "# Generated API keys for Claude Code API Gateway",
+            "REQUIRE_AUTH=true",
+            api_keys_line,
+        ]
     else:
-        print("Generated API Keys:")
-        print("-" * 50)
-        for i, key in enumerate(keys, 1):
-            print(f"Key {i}: {key}")
-        print("-" * 50)
-        print("\nTo use these keys, add them to your .env file:")
-        print(f"API_KEYS={','.join(keys)}")
+        lines = [
+            "Generated API Keys:",
+            "-" * 50,
+            *(f"Key {i}: {key}" for i, key in enumerate(keys, 1)),
+            "-" * 50,
+            "\nTo use these keys, add them to your .env file:",
+            api_keys_line,
+        ]
+    
+    # One write instead of a print() per line
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
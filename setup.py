@@ -39,6 +39,9 @@ setup(
             "httpx>=0.25.0",
             "pytest-mock>=3.12.0",
         ],
+        "speedups": [
+            "orjson>=3.9.0",
+        ],
         "dev": [
             "black>=23.0.0",
             "isort>=5.12.0",
@@ -16,6 +16,7 @@ sys.path.insert(0, str(PROJECT_ROOT))
 # Now import the app and configuration
 from claude_code_api.main import app
 from claude_code_api.core.config import settings
+from claude_code_api.core.scheduler import scheduler
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -32,6 +33,7 @@ def setup_test_environment():
         "database_url": getattr(settings, "database_url", "sqlite:///./test.db"),
         "debug": getattr(settings, "debug", False)
     }
+    original_state_file = scheduler.state_file
     
     # Set test settings
     settings.project_root = os.path.join(temp_dir, "projects")
@@ -40,6 +42,7 @@ def setup_test_environment():
     # settings.claude_binary_path should remain as found by find_claude_binary()
     settings.database_url = f"sqlite:///{temp_dir}/test.db"
     settings.debug = True
+    scheduler.state_file = Path(temp_dir) / "scheduler_state.json"
     
     # Create directories
     os.makedirs(settings.project_root, exist_ok=True)
@@ -56,6 +59,7 @@ def setup_test_environment():
     for key, value in original_settings.items():
         if value is not None:
             setattr(settings, key, value)
+    scheduler.state_file = original_state_file
 
 
 @pytest.fixture
@@ -0,0 +1,224 @@
+"""
+Unit tests for Claude API key rotation and error detection.
+
+These tests never touch the real shell configuration files: HOME is
+pointed at a temporary directory for every test.
+"""
+
+import os
+import stat
+
+import pytest
+
+from claude_code_api.core.key_manager import (
+    ClaudeKeyManager,
+    _atomic_write,
+    detect_claude_error,
+)
+
+pytestmark = pytest.mark.unit
+
+KEYS = [
+    {"name": "primary", "token": "sk-a", "base_url": "https://a.example"},
+    {"name": "backup1", "token": "sk-b", "base_url": "https://b.example"},
+    {"name": "backup2", "token": "sk-c", "base_url": "https://c.example"},
+]
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path, monkeypatch):
+    """Keep environment and shell config changes inside the test."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.delenv("ANTHROPIC_AUTH_TOKEN", raising=False)
+    monkeypatch.delenv("ANTHROPIC_BASE_URL", raising=False)
+    monkeypatch.setattr(ClaudeKeyManager, "_should_restart_on_rotate", lambda self: False)
+    return tmp_path
+
+
+@pytest.fixture
+def manager():
+    """Key manager with three keys."""
+    return ClaudeKeyManager(KEYS)
+
+
+class TestKeyRotation:
+    """Test rotation order and failover."""
+    
+    def test_rotate_cycles_through_keys(self, manager):
+        """Rotation visits every key in order and wraps around."""
+        visited = []
+        for _ in range(4):
+            assert manager.rotate_key()
+            visited.append(manager.current_index)
+        
+        assert visited == [1, 2, 0, 1]
+    
+    def test_mark_key_failed_skips_failed_key(self, manager):
+        """A failed key is left out of the rotation."""
+        assert manager.mark_key_failed("quota")
+        assert manager.current_index == 1
+        
+        visited = []
+        for _ in range(3):
+            manager.rotate_key()
+            visited.append(manager.current_index)
+        
+        assert visited == [2, 1, 2]
+        assert manager.get_status()["failed_keys"] == 1
+    
+    def test_mark_key_failed_applies_new_key(self, manager):
+        """The key rotated to is exported to the environment."""
+        manager.mark_key_failed("auth")
+        
+        assert os.environ["ANTHROPIC_AUTH_TOKEN"] == "sk-b"
+        assert os.environ["ANTHROPIC_BASE_URL"] == "https://b.example"
+    
+    def test_all_keys_failed_resets(self, manager):
+        """Once every key has failed, all keys become available again."""
+        assert manager.mark_key_failed("quota")
+        assert manager.mark_key_failed("quota")
+        assert manager.mark_key_failed("quota")
+        
+        status = manager.get_status()
+        assert manager.current_index == 0
+        assert status["failed_keys"] == 0
+        assert status["available_keys"] == 3
+        assert [key["status"] for key in status["keys_status"]] == ["active"] * 3
+    
+    def test_status_reflects_failures(self, manager):
+        """The cached per-key status is refreshed after a failure."""
+        before = manager.get_status()["keys_status"]
+        assert [key["current"] for key in before] == [True, False, False]
+        
+        manager.mark_key_failed("rate_limit")
+        after = manager.get_status()["keys_status"]
+        
+        assert after[0]["status"] == "failed"
+        assert [key["current"] for key in after] == [False, True, False]
+    
+    def test_applying_live_key_skips_rewrite(self, manager, monkeypatch):
+        """Re-applying the key that is already live does no file work."""
+        updates = []
+        monkeypatch.setattr(manager, "_update_shell_config_files", updates.append)
+        
+        assert manager.apply_current_key()
+        assert manager.apply_current_key()
+        
+        assert updates == ["sk-a"]
+    
+    def test_no_keys(self):
+        """A manager without keys cannot rotate."""
+        manager = ClaudeKeyManager([])
+        
+        assert manager.get_current_key() is None
+        assert not manager.rotate_key()
+        assert not manager.mark_key_failed()
+
+
+class TestShellConfigFiles:
+    """Test rewriting ANTHROPIC_AUTH_TOKEN in shell config files."""
+    
+    def test_replaces_existing_export(self, manager, isolated_home):
+        """An existing export is replaced in place."""
+        bashrc = isolated_home / ".bashrc"
+        bashrc.write_text("alias ll='ls -l'\nexport ANTHROPIC_AUTH_TOKEN=old\nexport PATH=$PATH\n")
+        
+        manager._update_shell_config_files("sk-new")
+        
+        assert bashrc.read_text() == (
+            "alias ll='ls -l'\nexport ANTHROPIC_AUTH_TOKEN=sk-new\nexport PATH=$PATH\n"
+        )
+    
+    def test_appends_missing_export(self, manager, isolated_home):
+        """An export is appended when the file has none."""
+        zshrc = isolated_home / ".zshrc"
+        zshrc.write_text("export PATH=$PATH\n")
+        
+        manager._update_shell_config_files("sk-new")
+        
+        assert zshrc.read_text() == "export PATH=$PATH\n\nexport ANTHROPIC_AUTH_TOKEN=sk-new\n"
+    
+    def test_token_is_shell_quoted(self, manager, isolated_home):
+        """Tokens with shell metacharacters are quoted."""
+        bashrc = isolated_home / ".bashrc"
+        bashrc.write_text("export ANTHROPIC_AUTH_TOKEN=old\n")
+        
+        manager._update_shell_config_files("sk-$(whoami)")
+        
+        assert bashrc.read_text() == "export ANTHROPIC_AUTH_TOKEN='sk-$(whoami)'\n"
+    
+    def test_current_token_is_not_rewritten(self, manager, isolated_home):
+        """A file that already exports the token is left untouched."""
+        bashrc = isolated_home / ".bashrc"
+        bashrc.write_text("export ANTHROPIC_AUTH_TOKEN=sk-new\n")
+        inode = bashrc.stat().st_ino
+        
+        manager._update_shell_config_files("sk-new")
+        
+        assert bashrc.stat().st_ino == inode
+        assert bashrc.read_text() == "export ANTHROPIC_AUTH_TOKEN=sk-new\n"
+    
+    def test_missing_files_are_not_created(self, manager, isolated_home):
+        """Only existing shell config files are touched."""
+        manager._update_shell_config_files("sk-new")
+        
+        assert not (isolated_home / ".bashrc").exists()
+        assert not (isolated_home / ".zshrc").exists()
+
+
+class TestAtomicWrite:
+    """Test atomic file replacement."""
+    
+    def test_replaces_content_and_keeps_mode(self, tmp_path):
+        """Content is replaced and permissions are preserved."""
+        target = tmp_path / "config"
+        target.write_text("old")
+        target.chmod(0o600)
+        
+        mtime = _atomic_write(str(target), "new")
+        
+        assert target.read_text() == "new"
+        assert stat.S_IMODE(target.stat().st_mode) == 0o600
+        assert mtime == target.stat().st_mtime_ns
+        assert [p.name for p in tmp_path.iterdir()] == ["config"]
+    
+    def test_writes_through_symlink(self, tmp_path):
+        """A symlinked file is updated without replacing the link."""
+        target = tmp_path / "real"
+        target.write_text("old")
+        link = tmp_path / "link"
+        link.symlink_to(target)
+        
+        _atomic_write(str(link), "new")
+        
+        assert link.is_symlink()
+        assert target.read_text() == "new"
+
+
+class TestDetectClaudeError:
+    """Test Claude CLI error detection."""
+    
+    @pytest.mark.parametrize("output, expected", [
+        ("Error: Insufficient quota for this request", "insufficient_quota"),
+        ("429 Too Many Requests", "rate_limit"),
+        ("Invalid API key provided", "auth_error"),
+        ("503 Service Unavailable", "server_error"),
+        ("everything is fine", None),
+        ("", None),
+    ])
+    def test_detects_error_type(self, output, expected):
+        """Each error family is recognised, case-insensitively."""
+        assert detect_claude_error(output) == expected
+    
+    def test_highest_priority_wins(self):
+        """When several errors appear, the highest-priority one is reported."""
+        output = "timeout while retrying; rate limit hit; unauthorized; quota exceeded"
+        assert detect_claude_error(output) == "insufficient_quota"
+        assert detect_claude_error("timeout after rate limit") == "rate_limit"
+        assert detect_claude_error("Service Unavailable: Unauthorized") == "auth_error"
+    
+    def test_accepts_raw_bytes(self):
+        """Raw subprocess stderr is matched without decoding."""
+        assert detect_claude_error(b"RATE LIMIT reached, quota exceeded") == "insufficient_quota"
+        assert detect_claude_error(b"internal server error") == "server_error"
+        assert detect_claude_error(b"") is None
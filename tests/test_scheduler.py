@@ -0,0 +1,366 @@
+"""
+Unit tests for the background task scheduler.
+
+Ticks are driven by hand where possible so the tests do not depend on
+wall-clock timing.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+import pytest_asyncio
+
+from claude_code_api.core import scheduler as scheduler_module
+from claude_code_api.core.scheduler import TaskScheduler, _RETRY_DELAY
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def state_file(tmp_path):
+    """Path of the scheduler state file for a test."""
+    return tmp_path / "scheduler.json"
+
+
+@pytest_asyncio.fixture
+async def scheduler(state_file):
+    """Scheduler bound to the test's event loop, with state kept in the test directory."""
+    scheduler = TaskScheduler(state_file=str(state_file))
+    scheduler._bind_loop()
+    return scheduler
+
+
+def make_task(calls, name, result=None):
+    """Create an async task function that records its runs."""
+    async def task():
+        calls.append(name)
+        if isinstance(result, Exception):
+            raise result
+    task.__name__ = name
+    return task
+
+
+class TestRegistration:
+    """Test task registration."""
+    
+    def test_interval_requires_positive_duration(self, scheduler):
+        """An interval of zero is rejected."""
+        with pytest.raises(ValueError):
+            scheduler.schedule_interval(make_task([], "noop"))
+        
+        with pytest.raises(ValueError):
+            scheduler.schedule_interval(make_task([], "noop"), hours=1, minutes=-60)
+    
+    def test_duplicate_names_rejected(self, scheduler):
+        """Task names must be unique, since state is keyed by them."""
+        scheduler.schedule_daily(make_task([], "cleanup"))
+        
+        with pytest.raises(ValueError):
+            scheduler.schedule_interval(make_task([], "cleanup"), hours=1)
+        
+        scheduler.schedule_interval(make_task([], "cleanup"), hours=1, name="cleanup_hourly")
+        assert [task["name"] for task in scheduler.tasks] == ["cleanup", "cleanup_hourly"]
+    
+    def test_lambda_requires_name(self, scheduler):
+        """Callables without a stable name must be given one."""
+        with pytest.raises(ValueError):
+            scheduler.schedule_interval(lambda: None, hours=1)
+        
+        scheduler.schedule_interval(lambda: None, hours=1, name="noop")
+        assert scheduler.tasks[0]["name"] == "noop"
+
+
+class TestTick:
+    """Test running due tasks from a tick."""
+    
+    @pytest.mark.asyncio
+    async def test_due_tasks_run_and_requeue_in_deadline_order(self, scheduler):
+        """Due tasks run, then are queued by their next run time."""
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "slow"), hours=2)
+        scheduler.schedule_interval(make_task(calls, "fast"), minutes=5)
+        
+        await scheduler._tick()
+        
+        assert sorted(calls) == ["fast", "slow"]
+        assert [entry[2]["func"].__name__ for entry in sorted(scheduler._heap)] == ["fast", "slow"]
+        deadline = scheduler._heap[0][0]
+        assert 5 * 60 - 5 < deadline - time.monotonic() <= 5 * 60
+        assert all(task["last_run"] is not None for task in scheduler.tasks)
+    
+    @pytest.mark.asyncio
+    async def test_tasks_not_due_are_left_queued(self, scheduler):
+        """A tick does not run tasks whose time has not come."""
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "hourly"), hours=1)
+        
+        await scheduler._tick()
+        await scheduler._tick()
+        
+        assert calls == ["hourly"]
+        assert len(scheduler._heap) == 1
+    
+    @pytest.mark.asyncio
+    async def test_failed_task_is_retried_later(self, scheduler, state_file):
+        """A failed run is retried after the retry delay and not recorded."""
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "flaky", RuntimeError("boom")), hours=6)
+        
+        await scheduler._tick()
+        
+        task = scheduler.tasks[0]
+        assert calls == ["flaky"]
+        assert task["last_run"] is None
+        assert len(scheduler._heap) == 1
+        deadline = scheduler._heap[0][0]
+        assert _RETRY_DELAY - 5 < deadline - time.monotonic() <= _RETRY_DELAY
+        assert not state_file.exists()
+    
+    @pytest.mark.asyncio
+    async def test_due_tasks_run_concurrently(self, scheduler):
+        """Due tasks overlap instead of running one after another."""
+        calls = []
+        
+        def make_slow_task(name):
+            async def task():
+                calls.append(f"{name}:start")
+                await asyncio.sleep(0.05)
+                calls.append(f"{name}:end")
+            task.__name__ = name
+            return task
+        
+        scheduler.schedule_interval(make_slow_task("first"), hours=1)
+        scheduler.schedule_interval(make_slow_task("second"), hours=1)
+        
+        await scheduler._tick()
+        
+        assert calls[:2] == ["first:start", "second:start"]
+        assert sorted(calls[2:]) == ["first:end", "second:end"]
+    
+    @pytest.mark.asyncio
+    async def test_sync_task_runs_in_executor(self, scheduler):
+        """Synchronous task functions are supported."""
+        calls = []
+        
+        def sync_task():
+            calls.append("sync")
+        
+        scheduler.schedule_interval(sync_task, hours=1)
+        await scheduler._tick()
+        
+        assert calls == ["sync"]
+    
+    @pytest.mark.asyncio
+    async def test_overlapping_run_is_skipped(self, scheduler):
+        """A task that is still running is not started a second time."""
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+        
+        async def long_task():
+            calls.append("run")
+            started.set()
+            await release.wait()
+        
+        scheduler.schedule_interval(long_task, hours=1)
+        task = scheduler.tasks[0]
+        now = time.monotonic()
+        
+        first = asyncio.create_task(scheduler._run_and_requeue(task, datetime.now(), now))
+        await started.wait()
+        await scheduler._run_and_requeue(task, datetime.now(), now)
+        release.set()
+        await first
+        
+        assert calls == ["run"]
+        # The registration entry plus one re-queue from the run that happened
+        assert len(scheduler._heap) == 2
+    
+    @pytest.mark.asyncio
+    async def test_daily_task_follows_wall_clock_steps(self, scheduler, monkeypatch):
+        """A daily task fires when the wall clock jumps past its slot."""
+        calls = []
+        scheduler.schedule_daily(make_task(calls, "nightly"))
+        task = scheduler.tasks[0]
+        task["next_run"] = time.time() + 3600
+        scheduler._heap = [(scheduler._deadline(task), 0, task)]
+        
+        await scheduler._tick()
+        assert calls == []
+        
+        real_time = time.time
+        monkeypatch.setattr(scheduler_module.time, "time", lambda: real_time() + 7200)
+        await scheduler._tick()
+        
+        assert calls == ["nightly"]
+
+
+class TestPersistence:
+    """Test persisting last run times across restarts."""
+    
+    @pytest.mark.asyncio
+    async def test_last_run_is_saved(self, scheduler, state_file):
+        """A successful run is recorded in the state file."""
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "hourly"), hours=1)
+        
+        await scheduler._tick()
+        
+        state = json.loads(state_file.read_text())
+        assert list(state) == ["hourly"]
+        assert state["hourly"] == scheduler.tasks[0]["last_run"].isoformat()
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_runs_are_all_saved(self, scheduler, state_file):
+        """Every task run concurrently is recorded in the state file."""
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "first"), hours=1)
+        scheduler.schedule_interval(make_task(calls, "second"), hours=1)
+        scheduler.schedule_interval(make_task(calls, "third"), hours=1)
+        
+        await scheduler._tick()
+        
+        state = json.loads(state_file.read_text())
+        assert sorted(state) == ["first", "second", "third"]
+    
+    @pytest.mark.asyncio
+    async def test_daily_task_does_not_refire_after_restart(self, state_file):
+        """A daily task that already ran today waits for tomorrow after a restart."""
+        calls = []
+        
+        first = TaskScheduler(state_file=str(state_file))
+        first.schedule_daily(make_task(calls, "nightly"), hour=0, minute=0)
+        await first.start()
+        await asyncio.sleep(0.1)
+        await first.stop()
+        assert calls == ["nightly"]
+        
+        second = TaskScheduler(state_file=str(state_file))
+        second.schedule_daily(make_task(calls, "nightly"), hour=0, minute=0)
+        await second.start()
+        await asyncio.sleep(0.1)
+        await second.stop()
+        
+        task = second.tasks[0]
+        assert calls == ["nightly"]
+        assert task["last_run"] is not None
+        assert task["next_run"] > time.time()
+    
+    @pytest.mark.asyncio
+    async def test_interval_resumes_from_last_run(self, state_file):
+        """An interval task restored from state is not run immediately."""
+        state_file.write_text(json.dumps({"hourly": datetime.now().isoformat()}))
+        calls = []
+        scheduler = TaskScheduler(state_file=str(state_file))
+        scheduler.schedule_interval(make_task(calls, "hourly"), hours=1)
+        
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        
+        assert calls == []
+        assert scheduler._heap[0][0] - time.monotonic() > 3500
+    
+    @pytest.mark.asyncio
+    async def test_corrupt_state_file_is_ignored(self, state_file):
+        """An unreadable state file is treated as empty."""
+        state_file.write_text("{not json")
+        calls = []
+        scheduler = TaskScheduler(state_file=str(state_file))
+        scheduler.schedule_interval(make_task(calls, "hourly"), hours=1)
+        
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        
+        assert calls == ["hourly"]
+
+
+class TestLifecycle:
+    """Test starting and stopping the scheduler."""
+    
+    @pytest.mark.asyncio
+    async def test_stop_cancels_the_loop(self, state_file):
+        """Stopping while the loop waits for a wake-up cancels it cleanly."""
+        scheduler = TaskScheduler(state_file=str(state_file))
+        scheduler.schedule_interval(make_task([], "hourly"), hours=1)
+        
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        
+        assert not scheduler.running
+        assert scheduler._background_task.cancelled()
+    
+    @pytest.mark.asyncio
+    async def test_tasks_frozen_while_running(self, state_file):
+        """The task list is a tuple while the scheduler runs."""
+        scheduler = TaskScheduler(state_file=str(state_file))
+        scheduler.schedule_interval(make_task([], "hourly"), hours=1)
+        
+        await scheduler.start()
+        assert isinstance(scheduler.tasks, tuple)
+        await scheduler.stop()
+        
+        assert isinstance(scheduler.tasks, list)
+    
+    @pytest.mark.asyncio
+    async def test_task_registered_after_start_runs(self, state_file):
+        """A task added to a running scheduler wakes the loop and runs."""
+        calls = []
+        scheduler = TaskScheduler(state_file=str(state_file))
+        scheduler.schedule_interval(make_task(calls, "hourly"), hours=1)
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        
+        scheduler.schedule_interval(make_task(calls, "late"), hours=1)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        
+        assert calls == ["hourly", "late"]
+        assert [task["name"] for task in scheduler.tasks] == ["hourly", "late"]
+    
+    @pytest.mark.asyncio
+    async def test_maintenance_schedule_restarts(self, state_file, monkeypatch):
+        """Setting up the maintenance schedule again after a stop restarts it."""
+        scheduler = TaskScheduler(state_file=str(state_file))
+        monkeypatch.setattr(scheduler_module, "scheduler", scheduler)
+        monkeypatch.setattr(scheduler_module, "run_maintenance_tasks", make_task([], "run_maintenance_tasks"))
+        monkeypatch.setattr(scheduler_module, "check_log_rotation", make_task([], "check_log_rotation"))
+        
+        await scheduler_module.setup_maintenance_schedule()
+        await scheduler.stop()
+        await scheduler_module.setup_maintenance_schedule()
+        
+        assert scheduler.running
+        assert sorted(task["name"] for task in scheduler.tasks) == [
+            "check_log_rotation", "run_maintenance_tasks"
+        ]
+        await scheduler.stop()
+    
+    def test_runs_again_on_a_new_event_loop(self, state_file):
+        """Restarting on another event loop still runs and records tasks."""
+        scheduler = TaskScheduler(state_file=str(state_file))
+        calls = []
+        scheduler.schedule_interval(make_task(calls, "first"), hours=1)
+        scheduler.schedule_interval(make_task(calls, "second"), hours=1)
+        
+        async def run_once():
+            await scheduler.start()
+            await asyncio.sleep(0.1)
+            await scheduler.stop()
+        
+        asyncio.run(run_once())
+        
+        # Make both tasks due again and forget their saved runs
+        state_file.unlink()
+        now = time.monotonic()
+        scheduler._heap = [(now, i, task) for i, task in enumerate(scheduler.tasks)]
+        asyncio.run(run_once())
+        
+        assert sorted(calls) == ["first", "first", "second", "second"]
+        assert sorted(json.loads(state_file.read_text())) == ["first", "second"]